@@ -0,0 +1,126 @@
+import anthropic
+import copy
+import functools
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+from typing import Optional
+import yaml
+
+try:
+    from yaml import CSafeLoader as _SafeLoader  # libyaml-backed parser
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+
+_CLIENT: Optional[anthropic.Client] = None
+_CLIENT_LOCK = threading.Lock()
+
+def get_client() -> anthropic.Client:
+    """
+    Return the process-wide Anthropic client, creating it on first use.
+
+    All analyzers share one HTTP/2 connection pool, so parallel requests
+    reuse warm connections instead of opening a new TLS session each.
+    DefaultHttpxClient keeps the SDK's connection limits and its long read
+    timeout, which large non-streaming responses need.
+    Call after load_dotenv so ANTHROPIC_API_KEY is set.
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = anthropic.Client(
+                api_key=os.getenv('ANTHROPIC_API_KEY'),
+                # BaseAnalyzer._call_with_retry is the only retry layer
+                max_retries=0,
+                http_client=anthropic.DefaultHttpxClient(http2=True)
+            )
+        return _CLIENT
+
+class BaseAnalyzer:
+    """Shared configuration loading and Claude API access for the analyzers."""
+
+    @staticmethod
+    def load_dotenv() -> None:
+        """Load environment variables."""
+        load_dotenv()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def _parse_config(config_path: str, mtime_ns: int) -> dict:
+        """Parse a YAML configuration file once per path and modification time."""
+        with open(config_path, 'r', encoding='utf-8') as file:
+            return yaml.load(file, Loader=_SafeLoader)
+
+    @staticmethod
+    def load_config(config_path: str) -> dict:
+        """
+        Load configuration from YAML file.
+
+        The parsed file is cached until it is modified, so repeated
+        instantiation does not re-read it; each caller gets its own copy.
+
+        Args:
+            config_path: Path to configuration file
+
+        Returns:
+            dict: Configuration dictionary
+        """
+        config_path = str(config_path)
+        mtime_ns = os.stat(config_path).st_mtime_ns
+        return copy.deepcopy(BaseAnalyzer._parse_config(config_path, mtime_ns))
+
+    @staticmethod
+    def _retry_after(error: anthropic.APIStatusError) -> Optional[float]:
+        """Return the server's Retry-After delay in seconds, if it sent one."""
+        try:
+            return float(error.response.headers.get('retry-after'))
+        except (TypeError, ValueError):
+            return None
+
+    def _create_message(self, params: dict):
+        """Send a single Messages API request."""
+        return self.client.messages.create(**params)
+
+    def _with_retry(self, func, *args, **kwargs):
+        """
+        Call an API function, retrying rate limits and server errors.
+
+        429 and 5xx responses (including 529 overloaded) and connection
+        errors are retried with exponential backoff and jitter, or after
+        the Retry-After delay when the API provides one. Other client
+        errors are raised at once.
+
+        Args:
+            func: Client method to call
+            *args, **kwargs: Arguments passed to func
+
+        Returns:
+            The result of func; the last error is raised if all retries fail
+        """
+        max_retries = max(1, self.config.get('max_retries', 3))
+        for attempt in range(max_retries):
+            try:
+                return func(*args, **kwargs)
+            except anthropic.APIStatusError as e:
+                if (e.status_code != 429 and e.status_code < 500) or attempt == max_retries - 1:
+                    raise
+                delay = self._retry_after(e)
+                time.sleep((2 ** attempt if delay is None else delay) + random.random())
+            except anthropic.APIConnectionError:
+                if attempt == max_retries - 1:
+                    raise
+                time.sleep(2 ** attempt + random.random())  # Exponential backoff
+
+    def _call_with_retry(self, params: dict):
+        """
+        Send a Messages API request with retries, see _with_retry.
+
+        Args:
+            params: Keyword arguments for messages.create
+
+        Returns:
+            The API response; the last error is raised if all retries fail
+        """
+        return self._with_retry(self._create_message, params)
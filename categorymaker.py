@@ -1,14 +1,112 @@
 import pandas as pd
-import anthropic
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-import os
-from dotenv import load_dotenv
 import re
-from typing import Dict, Optional
-import yaml
+import json
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from base_analyzer import BaseAnalyzer, get_client
 
-class FeedbackAnalyzer:
+# Output token limit of the model used by message_params
+MODEL_MAX_OUTPUT_TOKENS = 4096
+
+# Delimiter between results when several rows share one prompt
+ROW_SEPARATOR = '###ROW###'
+_ROW_LABEL_RE = re.compile(r"^\s*ROW\s*\d+\s*:\s*", re.IGNORECASE)
+
+# Patterns used by FeedbackAnalyzer.clean_text
+_CONTENT_BLOCK_RE = re.compile(r"\[?ContentBlock\(text='|'(?:, type='text')?\)\]?")
+_WS_RE = re.compile(r"\s+")
+_STRIP_CHARS = str.maketrans({'\\': None, '"': None, "'": None})
+
+# Keys every category configuration must define
+_REQUIRED_KEYS = frozenset(['column_mapping', 'analysis_context', 'primary_category', 'secondary_category'])
+
+# Message Batches API limits per batch, with headroom for the request envelope
+BATCH_MAX_REQUESTS = 100_000
+BATCH_MAX_BYTES = 250 * 1024 * 1024
+
+# Analyses that must never be served from a cache
+UNCACHEABLE_RESULTS = {"No input data", "No content in response", "Processing error"}
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache of analyses keyed on embedded feedback text.
+    
+    Requires the optional sentence-transformers and faiss packages.
+    """
+    def __init__(self, model_name: str, threshold: float, namespace: str,
+                 path: Optional[str] = None):
+        """
+        Initialize the embedding model and the similarity index.
+        
+        Args:
+            model_name: sentence-transformers model used for embeddings
+            threshold: Minimum cosine similarity for a cache hit
+            namespace: Hash of the non-row parts of the request; a persisted
+                cache saved under a different namespace or model is discarded
+            path: File prefix for persisting the cache between runs
+        """
+        import faiss
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        self.threshold = threshold
+        self.namespace = namespace
+        self.path = Path(path) if path else None
+        self.index = faiss.IndexFlatIP(self.model.get_sentence_embedding_dimension())
+        self.analyses: List[str] = []
+        self.lock = threading.Lock()
+
+        if self.path and self.path.with_suffix('.npy').exists():
+            with open(self.path.with_suffix('.json'), 'r', encoding='utf-8') as file:
+                saved = json.load(file)
+            if (isinstance(saved, dict) and saved.get('namespace') == namespace
+                    and saved.get('model') == model_name):
+                self.index.add(np.load(self.path.with_suffix('.npy')))
+                self.analyses = saved['analyses']
+            else:
+                print("Prompt or model changed since the semantic cache was saved; starting empty")
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed text as a normalized float32 row vector."""
+        return self.model.encode([text], normalize_embeddings=True).astype(np.float32)
+
+    def get(self, text: str) -> Optional[str]:
+        """Return the cached analysis of the most similar text, if close enough."""
+        if self.index.ntotal == 0:
+            return None
+        embedding = self.embed(text)
+        with self.lock:
+            similarities, ids = self.index.search(embedding, 1)
+            if similarities[0][0] > self.threshold:
+                return self.analyses[ids[0][0]]
+        return None
+
+    def put(self, text: str, analysis: str) -> None:
+        """Add an analysis to the cache."""
+        embedding = self.embed(text)
+        with self.lock:
+            self.index.add(embedding)
+            self.analyses.append(analysis)
+
+    def save(self) -> None:
+        """Persist embeddings and analyses to disk."""
+        if not self.path:
+            return
+        with self.lock:
+            np.save(self.path.with_suffix('.npy'), self.index.reconstruct_n(0, self.index.ntotal))
+            with open(self.path.with_suffix('.json'), 'w', encoding='utf-8') as file:
+                json.dump({'namespace': self.namespace, 'model': self.model_name,
+                           'analyses': self.analyses}, file, ensure_ascii=False)
+
+class FeedbackAnalyzer(BaseAnalyzer):
     def __init__(self, config_path: str):
         """
         Initialize the FeedbackAnalyzer with configuration.
@@ -17,36 +115,40 @@ class FeedbackAnalyzer:
             config_path: Path to the YAML configuration file
         """
         self.load_dotenv()
-        self.client = anthropic.Client(api_key=os.getenv('ANTHROPIC_API_KEY'))
+        self.client = get_client()
         self.config = self.load_config(config_path)
         self.validate_config()
         # Store the analysis context as class variable
         self.analysis_context = self.config['analysis_context']
+        self.max_workers = self.config.get('max_workers', 8)
+        # Spaces request starts across all worker threads to stay under the
+        # account's requests-per-minute limit; max_workers caps concurrency
+        requests_per_minute = self.config.get('requests_per_minute')
+        self.request_interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.next_request_time = 0.0
+        self.rate_lock = threading.Lock()
+        # Exact-match cache of analyses, keyed on a hash of the full request
+        self.cache = None
+        self.cache_lock = threading.Lock()
+        cache_path = self.config.get('cache_path', '.feedback_cache.sqlite')
+        if cache_path:
+            # Shared by the pool workers; every access holds cache_lock
+            self.cache = sqlite3.connect(cache_path, check_same_thread=False)
+            self.cache.execute("CREATE TABLE IF NOT EXISTS analyses (key TEXT PRIMARY KEY, analysis TEXT)")
+        self.semantic_cache = None
+        if self.config.get('semantic_cache', False):
+            self.semantic_cache = SemanticCache(
+                self.config.get('semantic_cache_model', 'sentence-transformers/all-MiniLM-L6-v2'),
+                self.config.get('semantic_cache_threshold', 0.95),
+                # Hash of the request without any row data
+                self.cache_key(""),
+                self.config.get('semantic_cache_path', '.semantic_cache')
+            )
         
-    @staticmethod
-    def load_dotenv() -> None:
-        """Load environment variables."""
-        load_dotenv()
-    
-    @staticmethod
-    def load_config(config_path: str) -> dict:
-        """
-        Load configuration from YAML file.
-        
-        Args:
-            config_path: Path to configuration file
-            
-        Returns:
-            dict: Configuration dictionary
-        """
-        with open(config_path, 'r', encoding='utf-8') as file:
-            return yaml.safe_load(file)
-    
     def validate_config(self) -> None:
         """Validate the configuration structure."""
-        required_keys = ['column_mapping', 'analysis_context', 'primary_category', 'secondary_category']
-        if not all(key in self.config for key in required_keys):
-            raise ValueError(f"Configuration must contain: {', '.join(required_keys)}")
+        if not _REQUIRED_KEYS.issubset(self.config):
+            raise ValueError(f"Configuration must contain: {', '.join(sorted(_REQUIRED_KEYS))}")
     
     def clean_text(self, text: str) -> str:
         """
@@ -61,78 +163,499 @@ class FeedbackAnalyzer:
         if not isinstance(text, str):
             return ""
             
-        # Remove ContentBlock formatting
-        text = re.sub(r'\[?ContentBlock\(text=\'|\'(?:, type=\'text\')?\)\]?', '', text)
-        # Replace escaped newlines with actual newlines
-        text = text.replace('\\n', '\n')
-        # Remove any remaining backslashes
-        text = text.replace('\\', '')
-        # Replace multiple spaces with a single space
-        text = re.sub(r'\s+', ' ', text)
-        # Remove any remaining quotes
-        text = text.replace('"', '').replace("'", "")
-        # Strip leading/trailing whitespace
-        return text.strip()
-
-    def process_row(self, row: pd.Series) -> str:
+        # Remove ContentBlock formatting and replace escaped newlines with actual newlines
+        text = _CONTENT_BLOCK_RE.sub('', text).replace('\\n', '\n')
+        # Remove backslashes and quotes in a single pass
+        text = text.translate(_STRIP_CHARS)
+        # Replace multiple spaces with a single space and strip leading/trailing whitespace
+        return _WS_RE.sub(' ', text).strip()
+
+    def format_row(self, row: Dict) -> str:
         """
-        Process a single row of feedback data.
+        Format the mapped feedback fields of a single row.
         
         Args:
-            row: Pandas Series containing feedback data
+            row: Dict or Pandas Series containing feedback data
             
         Returns:
-            str: Processed analysis result
+            str: One "topic: value" line per non-empty mapped column
+        """
+        lines = [f"{topic}: {row[col]}\n"
+                 for col, topic in self.config['column_mapping'].items()
+                 if col in row and pd.notna(row[col])]
+        return "".join(lines)
+
+    def mapped_records(self, df: pd.DataFrame) -> List[Dict]:
         """
-        # Debug print to see what data we're receiving
-        #print("Input row data:")
-        #for col, topic in self.config['column_mapping'].items():
-            #if col in row.index:
-                #print(f"{topic}: {row[col]}")
+        Extract the mapped columns of each row as plain dicts.
         
-        prompt = f"{self.analysis_context}\n\n"
+        Avoids building a Pandas Series per row as iterrows does.
         
-        # Build prompt with actual data
-        has_data = False
-        for col, topic in self.config['column_mapping'].items():
-            if col in row.index and pd.notna(row[col]):
-                prompt += f"{topic}: {row[col]}\n"
-                has_data = True
+        Args:
+            df: DataFrame containing feedback data
+            
+        Returns:
+            List[Dict]: One dict per row, in df order
+        """
+        mapped_cols = [col for col in self.config['column_mapping'] if col in df.columns]
+        return df[mapped_cols].to_dict('records')
+
+    def build_prompt(self, row_text: str) -> str:
+        """
+        Build the analysis prompt for a single row of feedback data.
+        
+        Args:
+            row_text: Formatted feedback fields from format_row
+            
+        Returns:
+            str: Prompt text
+        """
+        return f"{self.analysis_context}\n\n{row_text}"
+
+    def cache_key(self, row_text: str, marshaled: bool = False) -> str:
+        """
+        Hash everything that determines the analysis of a row.
+        
+        Args:
+            row_text: Formatted feedback fields from format_row
+            marshaled: Key for a result split out of a multi-row prompt,
+                kept apart from single-row results
+            
+        Returns:
+            str: SHA-256 hex digest
+        """
+        params = self.message_params(self.build_prompt(row_text))
+        payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        if marshaled:
+            payload = f"{ROW_SEPARATOR}\n{payload}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def lookup_cache(self, row_text: str, marshaled: bool = False) -> Optional[str]:
+        """
+        Look up a previous analysis for the same or similar feedback.
+        
+        Args:
+            row_text: Formatted feedback fields from format_row
+            marshaled: Also accept results stored from multi-row prompts
+            
+        Returns:
+            Optional[str]: Cached analysis, or None on a miss
+        """
+        if self.cache is not None:
+            keys = [self.cache_key(row_text)]
+            if marshaled:
+                keys.append(self.cache_key(row_text, marshaled=True))
+            for key in keys:
+                with self.cache_lock:
+                    found = self.cache.execute("SELECT analysis FROM analyses WHERE key = ?", (key,)).fetchone()
+                if found is not None:
+                    return found[0]
+        if self.semantic_cache is not None:
+            return self.semantic_cache.get(row_text)
+        return None
+
+    def store_cache(self, row_text: str, analysis: str, marshaled: bool = False) -> None:
+        """
+        Store an analysis for later lookups.
+        
+        Results from multi-row prompts are stored under their own exact
+        key and never in the semantic cache, so single-row lookups only
+        return single-row answers.
+        
+        Args:
+            row_text: Formatted feedback fields from format_row
+            analysis: Cleaned analysis result
+            marshaled: Whether the result was split out of a multi-row prompt
+        """
+        if analysis in UNCACHEABLE_RESULTS:
+            return
+        if self.cache is not None:
+            key = self.cache_key(row_text, marshaled)
+            with self.cache_lock:
+                with self.cache:
+                    self.cache.execute("INSERT OR REPLACE INTO analyses VALUES (?, ?)", (key, analysis))
+        if self.semantic_cache is not None and not marshaled:
+            self.semantic_cache.put(row_text, analysis)
+
+    def save_cache(self) -> None:
+        """Persist caches to disk."""
+        if self.cache is not None:
+            with self.cache_lock:
+                self.cache.commit()
+        if self.semantic_cache is not None:
+            self.semantic_cache.save()
+
+    def message_params(self, prompt: str, max_tokens: int = 4000) -> dict:
+        """
+        Build the Messages API parameters for a prompt.
+        
+        Args:
+            prompt: Prompt text
+            max_tokens: Maximum number of tokens in the response
+            
+        Returns:
+            dict: Keyword arguments for messages.create / batch requests
+        """
+        return {
+            'model': "claude-3-5-sonnet-20240620",
+            'max_tokens': max_tokens,
+            'temperature': 0,
+            'system': self.config.get('system_prompt', "You are an expert in analyzing open-ended survey responses."),
+            'messages': [{"role": "user", "content": prompt}]
+        }
+
+    def wait_for_rate_limit(self) -> None:
+        """Block until the next request may start under requests_per_minute."""
+        if not self.request_interval:
+            return
+        with self.rate_lock:
+            now = time.monotonic()
+            start = max(now, self.next_request_time)
+            self.next_request_time = start + self.request_interval
+        time.sleep(start - now)
+
+    def _create_message(self, params: dict):
+        """Send a single Messages API request within the rate limit."""
+        self.wait_for_rate_limit()
+        return self.client.messages.create(**params)
+
+    def process_row(self, row: Dict) -> str:
+        """
+        Process a single row of feedback data.
+        
+        Args:
+            row: Dict or Pandas Series containing feedback data
+            
+        Returns:
+            str: Processed analysis result
+        """
+        row_text = self.format_row(row)
         
-        if not has_data:
+        if not row_text:
             print("No data found in row!")
             return "No input data"
 
+        cached = self.lookup_cache(row_text)
+        if cached is not None:
+            return cached
+
+        prompt = self.build_prompt(row_text)
+
         # Debug print the prompt
         #print("\nGenerated prompt:")
         #print(prompt)
             
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = self.client.messages.create(
-                    model="claude-3-5-sonnet-20240620",
-                    max_tokens=4000,
-                    temperature=0,
-                    system=self.config.get('system_prompt', "You are an expert in analyzing open-ended survey responses."),
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                
-                # Extract the text content directly from the first message
-                if response.content and len(response.content) > 0:
-                    return self.clean_text(response.content[0].text)
-                return "No content in response"
-                
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                else:
-                    print(f"Error processing row: {e}")
-                    return "Processing error"
+        try:
+            response = self._call_with_retry(self.message_params(prompt))
+        except Exception as e:
+            print(f"Error processing row: {e}")
+            return "Processing error"
+        
+        # Extract the text content directly from the first message
+        if response.content and len(response.content) > 0:
+            analysis = self.clean_text(response.content[0].text)
+            self.store_cache(row_text, analysis)
+            return analysis
+        return "No content in response"
+
+    def process_batch(self, rows: List[Dict]) -> List[str]:
+        """
+        Process several rows of feedback data in a single prompt.
+        
+        Falls back to process_row for each row if the response cannot be
+        split into one result per row.
+        
+        Args:
+            rows: List of dicts containing feedback data
+            
+        Returns:
+            List[str]: Processed analysis results, one per row
+        """
+        if len(rows) == 1:
+            return [self.process_row(rows[0])]
+        
+        results = ["No input data"] * len(rows)
+        marshaled = []
+        for pos, row in enumerate(rows):
+            row_text = self.format_row(row)
+            if not row_text:
+                continue
+            cached = self.lookup_cache(row_text, marshaled=True)
+            if cached is not None:
+                results[pos] = cached
+            else:
+                marshaled.append((pos, row_text))
+        if not marshaled:
+            return results
+        
+        prompt = (
+            f"{self.analysis_context}\n\n"
+            f"Analyze each of the following {len(marshaled)} responses separately. "
+            f"Return one result per response, in the same order, separated by '{ROW_SEPARATOR}'. "
+            f"Do not repeat the ROW labels in your answer.\n\n"
+        )
+        prompt += "\n".join(f"ROW {n}:\n{text}" for n, (_, text) in enumerate(marshaled, 1))
+        
+        try:
+            response = self._call_with_retry(
+                self.message_params(prompt, max_tokens=self.config.get(
+                    'marshal_max_tokens', min(4000 * len(marshaled), MODEL_MAX_OUTPUT_TOKENS)))
+            )
+            text = response.content[0].text if response.content else ""
+        except Exception as e:
+            print(f"Error processing batch: {e}")
+            text = ""
+        
+        # Drop ROW labels in case the model echoes them back
+        parts = [_ROW_LABEL_RE.sub('', part) for part in text.split(ROW_SEPARATOR) if part.strip()]
+        if len(parts) != len(marshaled):
+            print(f"Expected {len(marshaled)} results, got {len(parts)}; processing rows one by one")
+            for pos, _ in marshaled:
+                results[pos] = self.process_row(rows[pos])
+            return results
+        
+        for (pos, row_text), part in zip(marshaled, parts):
+            results[pos] = self.clean_text(part)
+            self.store_cache(row_text, results[pos], marshaled=True)
+        return results
+
+    def process_rows_parallel(self, df: pd.DataFrame) -> Iterator[Tuple[int, List[str]]]:
+        """
+        Process rows concurrently with a bounded thread pool.
+        
+        Rows are grouped into prompts of marshal_batch_size rows each.
+        
+        Args:
+            df: DataFrame containing feedback data
+            
+        Yields:
+            Tuple[int, List[str]]: Position of the first row and the analyses
+            of consecutive rows, in completion order
+        """
+        rows = self.mapped_records(df)
+        size = max(1, self.config.get('marshal_batch_size', 1))
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool, \
+                tqdm(total=len(rows), desc="Analyzing responses") as progress:
+            futures = {
+                pool.submit(self.process_batch, rows[start:start + size]): start
+                for start in range(0, len(rows), size)
+            }
+            for future in as_completed(futures):
+                analyses = future.result()
+                progress.update(len(analyses))
+                yield futures[future], analyses
+
+    def process_with_batch_api(self, df: pd.DataFrame) -> pd.Series:
+        """
+        Process all rows as asynchronous Message Batches jobs.
+        
+        Batch requests are billed at half the price of regular calls and
+        are not limited by the per-minute request ceiling. Inputs above the
+        per-batch limits are split into several jobs.
+        
+        Args:
+            df: DataFrame containing feedback data
+            
+        Returns:
+            pd.Series: Analysis results aligned with df.index
+        """
+        results = pd.Series("No input data", index=df.index, dtype=object)
+        
+        # custom_id must be short and alphanumeric, so use row positions
+        requests = []
+        row_texts = {}
+        for pos, row in enumerate(self.mapped_records(df)):
+            row_text = self.format_row(row)
+            if not row_text:
+                continue
+            cached = self.lookup_cache(row_text)
+            if cached is not None:
+                results.iat[pos] = cached
+                continue
+            row_texts[pos] = row_text
+            requests.append({'custom_id': f"row-{pos}", 'params': self.message_params(self.build_prompt(row_text))})
+        
+        if not requests:
+            return results
+        
+        batches = self.client.messages.batches
+        state_path = Path(self.config.get('batch_state_path', '.batch_state.json'))
+        state = json.loads(state_path.read_text(encoding='utf-8')) if state_path.exists() else {}
+        
+        # Submit each chunk once; the saved batch ids let a crashed run resume
+        # polling instead of paying for the same requests again
+        batch_ids = []
+        for chunk in self.split_batch_requests(requests):
+            chunk_key = hashlib.sha256(json.dumps(chunk, sort_keys=True).encode('utf-8')).hexdigest()
+            if chunk_key in state:
+                print(f"Resuming batch {state[chunk_key]} with {len(chunk)} requests")
+            else:
+                state[chunk_key] = self._with_retry(batches.create, requests=chunk).id
+                state_path.write_text(json.dumps(state), encoding='utf-8')
+                print(f"Submitted batch {state[chunk_key]} with {len(chunk)} requests")
+            batch_ids.append(state[chunk_key])
+        
+        poll_interval = self.config.get('batch_poll_interval', 30)
+        for batch_id in batch_ids:
+            batch = self._with_retry(batches.retrieve, batch_id)
+            while batch.processing_status != 'ended':
+                time.sleep(poll_interval)
+                batch = self._with_retry(batches.retrieve, batch_id)
+                counts = batch.request_counts
+                print(f"Batch {batch.id}: {counts.processing} processing, "
+                      f"{counts.succeeded} succeeded, {counts.errored} errored")
+            
+            # Read the whole result stream inside the retry so a dropped
+            # connection re-downloads it instead of ending the run
+            entries = self._with_retry(lambda: list(batches.results(batch_id)))
+            self.collect_batch_results(entries, df, row_texts, results)
+        
+        state_path.unlink(missing_ok=True)
+        return results
+
+    def split_batch_requests(self, requests: List[dict]) -> List[List[dict]]:
+        """
+        Split batch requests to stay within the Message Batches API limits.
+        
+        Args:
+            requests: Batch request records
+            
+        Returns:
+            List[List[dict]]: Chunks of at most BATCH_MAX_REQUESTS requests
+            and roughly BATCH_MAX_BYTES of JSON each
+        """
+        chunks = [[]]
+        chunk_bytes = 0
+        for request in requests:
+            request_bytes = len(json.dumps(request).encode('utf-8'))
+            if chunks[-1] and (len(chunks[-1]) >= BATCH_MAX_REQUESTS
+                               or chunk_bytes + request_bytes > BATCH_MAX_BYTES):
+                chunks.append([])
+                chunk_bytes = 0
+            chunks[-1].append(request)
+            chunk_bytes += request_bytes
+        return chunks
+
+    def collect_batch_results(self, entries: list, df: pd.DataFrame,
+                              row_texts: Dict[int, str], results: pd.Series) -> None:
+        """
+        Store the results of one finished batch by row position.
+        
+        Args:
+            entries: Result entries from messages.batches.results
+            df: DataFrame the batch was built from
+            row_texts: Formatted feedback fields by row position
+            results: Analysis results to update in place
+        """
+        for entry in entries:
+            pos = int(entry.custom_id.split('-', 1)[1])
+            if entry.result.type != 'succeeded':
+                print(f"Error processing row {df.index[pos]}: {entry.result.type}")
+                results.iat[pos] = "Processing error"
+                continue
+            message = entry.result.message
+            if message.content and len(message.content) > 0:
+                results.iat[pos] = self.clean_text(message.content[0].text)
+                self.store_cache(row_texts[pos], results.iat[pos])
+            else:
+                results.iat[pos] = "No content in response"
+
+    def iter_analyses(self, df: pd.DataFrame) -> Iterator[Tuple[List[int], List[str]]]:
+        """
+        Analyze all rows, yielding results as they become available.
+        
+        Rows without data in any mapped column are answered without an API
+        call. Large inputs go through the Message Batches API, small ones
+        row by row.
+        
+        Args:
+            df: DataFrame containing feedback data
+            
+        Yields:
+            Tuple[List[int], List[str]]: Row positions in df and their analyses
+        """
+        mapped_cols = [col for col in self.config['column_mapping'] if col in df.columns]
+        has_data = df[mapped_cols].notna().any(axis=1).to_numpy()
+        data_positions = np.flatnonzero(has_data)
+        
+        empty_positions = np.flatnonzero(~has_data).tolist()
+        if empty_positions:
+            print(f"Skipping {len(empty_positions)} rows without input data")
+            yield empty_positions, ["No input data"] * len(empty_positions)
+        
+        df_to_process = df.iloc[data_positions]
+        if self.config.get('use_batch_api', False) and len(df_to_process) >= self.config.get('batch_api_threshold', 100):
+            yield data_positions.tolist(), self.process_with_batch_api(df_to_process).tolist()
+        else:
+            for start, batch in self.process_rows_parallel(df_to_process):
+                yield data_positions[start:start + len(batch)].tolist(), batch
+
+    def extract_categories(self, analyses: pd.Series) -> pd.DataFrame:
+        """
+        Extract the category columns from a Series of analyses.
+        
+        Args:
+            analyses: Raw analysis texts
+            
+        Returns:
+            pd.DataFrame: Primary and secondary categories, aligned with analyses
+        """
+        parts = analyses.str.split('---')
+        # Keep the text after the first colon of each part, as extract_elements does
+        primary = parts.str[0].fillna('').str.split(':', n=1).str[-1].str.strip()
+        secondary = parts.str[1].fillna('').str.split(':', n=1).str[-1].str.strip()
+        
+        return pd.DataFrame({
+            f'{self.config["primary_category"]}_categories': primary,
+            f'{self.config["secondary_category"]}_categories': secondary
+        }, index=analyses.index)
+
+    def write_parquet(self, df: pd.DataFrame, output_file: str) -> None:
+        """
+        Analyze rows and stream the results to a Parquet file.
+        
+        Results are written in row groups as they complete, so output is
+        never held in memory for the whole file. Rows appear in completion
+        order; the original index is stored to restore input order.
+        
+        Args:
+            df: DataFrame containing feedback data
+            output_file: Path of the Parquet file to write
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        row_group_size = self.config.get('parquet_row_group_size', 1000)
+        category_columns = [f'{self.config["primary_category"]}_categories',
+                            f'{self.config["secondary_category"]}_categories']
+        # Excel exports often mix numbers and text in one column, which Arrow
+        # cannot infer a type for; store such columns as strings (NaN stays null)
+        output_df = df.astype({col: 'string' for col in df.columns[df.dtypes == object]})
+        schema = pa.Schema.from_pandas(output_df.assign(**{col: '' for col in category_columns}), preserve_index=True)
+        positions, analyses = [], []
+
+        def flush() -> None:
+            chunk = output_df.iloc[positions]
+            chunk = chunk.join(self.extract_categories(pd.Series(analyses, index=chunk.index)))
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=True))
+            positions.clear()
+            analyses.clear()
+
+        with pq.ParquetWriter(output_file, schema) as writer:
+            for batch_positions, batch in self.iter_analyses(df):
+                positions.extend(batch_positions)
+                analyses.extend(batch)
+                if len(positions) >= row_group_size:
+                    flush()
+            if positions:
+                flush()
 
     def extract_elements(self, analysis: str) -> pd.Series:
         """
-        Extract analyzed elements from the response.
+        Extract analyzed elements from a single response.
+        
+        extract_categories does the same for a whole Series at once.
         
         Args:
             analysis: Raw analysis text
@@ -169,19 +692,30 @@ class FeedbackAnalyzer:
         # Remove entirely empty rows
         df = df.dropna(how='all')
 
-        # Process each row
-        tqdm.pandas(desc="Analyzing responses")
-        df['Analyysi'] = df.progress_apply(lambda row: self.process_row(row), axis=1)
+        if self.config.get('output_format', 'xlsx') == 'parquet':
+            output_file = str(Path(output_file).with_suffix('.parquet'))
+            self.write_parquet(df, output_file)
+            self.save_cache()
+        else:
+            analyses = [""] * len(df)
+            for positions, batch in self.iter_analyses(df):
+                for pos, analysis in zip(positions, batch):
+                    analyses[pos] = analysis
+            df['Analyysi'] = analyses
+
+            # Extract specific elements from the analysis
+            df[[f'{self.config["primary_category"]}_categories', 
+                f'{self.config["secondary_category"]}_categories']] = self.extract_categories(df['Analyysi'])
 
-        # Extract specific elements from the analysis
-        df[[f'{self.config["primary_category"]}_categories', 
-            f'{self.config["secondary_category"]}_categories']] = df['Analyysi'].apply(self.extract_elements)
+            self.save_cache()
 
-        # Drop the 'Analyysi' column as it's no longer needed
-        df = df.drop(columns=['Analyysi'])
+            # Drop the 'Analyysi' column as it's no longer needed
+            df = df.drop(columns=['Analyysi'])
 
-        # Write the results to a new Excel file
-        df.to_excel(output_file, index=False)
+            # Write the results to a new Excel file. xlsxwriter's constant_memory
+            # mode must not be used: pandas writes column by column, and rows
+            # flushed in that mode silently drop later cells.
+            df.to_excel(output_file, index=False, engine='xlsxwriter')
 
         print(f"Analysis complete. Results saved to '{output_file}'")
 
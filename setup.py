@@ -6,11 +6,14 @@ setup(
     packages=find_packages(),  # Removed the src directory specification
     install_requires=[
         "pandas>=2.0.0",
-        "anthropic>=0.8.0",
+        "anthropic>=0.39.0",
         "python-dotenv>=1.0.0",
         "pyyaml>=6.0.0",
         "tqdm>=4.66.0",
         "openpyxl>=3.1.0",
+        "xlsxwriter>=3.0.0",
+        "pyarrow>=14.0.0",
+        "h2>=4.0.0",
     ],
     author="Juhani Merilehto",
     author_email="juhani.merilehto@protonmail.com",
@@ -0,0 +1,77 @@
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import anthropic
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import base_analyzer
+from base_analyzer import BaseAnalyzer
+
+
+def status_error(status_code: int) -> anthropic.APIStatusError:
+    """Build an APIStatusError without depending on the SDK's HTTP classes."""
+    error = anthropic.APIStatusError.__new__(anthropic.APIStatusError)
+    error.status_code = status_code
+    error.response = SimpleNamespace(headers={})
+    return error
+
+
+class FlakyAnalyzer(BaseAnalyzer):
+    """Raises the queued errors from _create_message, then succeeds."""
+
+    def __init__(self, errors, max_retries=3):
+        self.config = {'max_retries': max_retries}
+        self.errors = list(errors)
+        self.calls = 0
+
+    def _create_message(self, params):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'response'
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(base_analyzer.time, 'sleep', lambda seconds: None)
+
+
+def test_call_with_retry_retries_overloaded_and_unavailable():
+    analyzer = FlakyAnalyzer([status_error(529), status_error(503)])
+    assert analyzer._call_with_retry({}) == 'response'
+    assert analyzer.calls == 3
+
+
+def test_call_with_retry_raises_client_errors_at_once():
+    analyzer = FlakyAnalyzer([status_error(400)])
+    with pytest.raises(anthropic.APIStatusError):
+        analyzer._call_with_retry({})
+    assert analyzer.calls == 1
+
+
+def test_call_with_retry_raises_after_last_attempt():
+    analyzer = FlakyAnalyzer([status_error(529)] * 3)
+    with pytest.raises(anthropic.APIStatusError):
+        analyzer._call_with_retry({})
+    assert analyzer.calls == 3
+
+
+def test_call_with_retry_makes_at_least_one_attempt():
+    analyzer = FlakyAnalyzer([], max_retries=0)
+    assert analyzer._call_with_retry({}) == 'response'
+
+
+def test_load_config_rereads_modified_file(tmp_path):
+    config_file = tmp_path / 'config.yaml'
+    config_file.write_text('output_format: xlsx\n', encoding='utf-8')
+    assert BaseAnalyzer.load_config(str(config_file))['output_format'] == 'xlsx'
+
+    config_file.write_text('output_format: parquet\n', encoding='utf-8')
+    stat = config_file.stat()
+    # Guarantee a new mtime even on filesystems with coarse timestamps
+    os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert BaseAnalyzer.load_config(str(config_file))['output_format'] == 'parquet'
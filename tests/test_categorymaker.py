@@ -0,0 +1,151 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import anthropic
+import pandas as pd
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import base_analyzer
+import categorymaker
+
+ANSWER = "Needs: mentoring; time --- Feedback: good pace"
+
+
+class StubMessages:
+    """Stands in for client.messages, answering every row the same way."""
+
+    def create(self, **params):
+        return SimpleNamespace(content=[SimpleNamespace(text=ANSWER)])
+
+
+class MarshalMessages:
+    """Answers multi-row prompts with a fixed text and single rows with ANSWER."""
+
+    def __init__(self, marshaled_answer):
+        self.marshaled_answer = marshaled_answer
+        self.calls = 0
+
+    def create(self, **params):
+        self.calls += 1
+        prompt = params['messages'][0]['content']
+        text = self.marshaled_answer if categorymaker.ROW_SEPARATOR in prompt else ANSWER
+        return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+
+class StubBatches:
+    """Stands in for client.messages.batches; the first retrieve fails with a 503."""
+
+    def __init__(self):
+        self.submitted = {}
+        self.failed_once = False
+
+    def create(self, requests):
+        batch_id = f"batch-{len(self.submitted)}"
+        self.submitted[batch_id] = requests
+        return SimpleNamespace(id=batch_id)
+
+    def retrieve(self, batch_id):
+        if not self.failed_once:
+            self.failed_once = True
+            error = anthropic.APIStatusError.__new__(anthropic.APIStatusError)
+            error.status_code = 503
+            error.response = SimpleNamespace(headers={})
+            raise error
+        counts = SimpleNamespace(processing=0, succeeded=len(self.submitted[batch_id]), errored=0)
+        return SimpleNamespace(id=batch_id, processing_status='ended', request_counts=counts)
+
+    def results(self, batch_id):
+        message = SimpleNamespace(content=[SimpleNamespace(text=ANSWER)])
+        for request in self.submitted[batch_id]:
+            yield SimpleNamespace(custom_id=request['custom_id'],
+                                  result=SimpleNamespace(type='succeeded', message=message))
+
+
+def make_analyzer(tmp_path, monkeypatch, messages, **config):
+    """Build a FeedbackAnalyzer backed by a stub client and a temporary config."""
+    monkeypatch.setattr(categorymaker, 'get_client', lambda: SimpleNamespace(messages=messages))
+    config = {
+        'column_mapping': {'tyo': 'primary_feedback', 'yleis': 'general_feedback'},
+        'analysis_context': 'Analyze the following feedback.',
+        'primary_category': 'support needs',
+        'secondary_category': 'general feedback',
+        'cache_path': None,
+        **config,
+    }
+    config_file = tmp_path / 'config.yaml'
+    config_file.write_text(yaml.safe_dump(config), encoding='utf-8')
+    return categorymaker.FeedbackAnalyzer(str(config_file))
+
+
+def write_input(path):
+    pd.DataFrame({
+        'tyo': ['too fast', None, 'more support', 'fine'],
+        'yleis': ['ok', None, None, 'great'],
+        'meta': [1, 'b', 3, 4],
+    }).to_excel(path, index=False)
+
+
+def test_analyze_feedback_excel_round_trip(tmp_path, monkeypatch):
+    analyzer = make_analyzer(tmp_path, monkeypatch, StubMessages())
+    write_input(tmp_path / 'input.xlsx')
+
+    analyzer.analyze_feedback(str(tmp_path / 'input.xlsx'), str(tmp_path / 'output.xlsx'))
+
+    result = pd.read_excel(tmp_path / 'output.xlsx')
+    assert result['meta'].astype(str).tolist() == ['1', 'b', '3', '4']
+    assert result['support needs_categories'].tolist() == [
+        'mentoring; time', 'No input data', 'mentoring; time', 'mentoring; time'
+    ]
+    assert result['general feedback_categories'].fillna('').tolist() == [
+        'good pace', '', 'good pace', 'good pace'
+    ]
+
+
+def test_batch_api_splits_requests_and_retries_polling(tmp_path, monkeypatch):
+    batches = StubBatches()
+    messages = SimpleNamespace(batches=batches)
+    analyzer = make_analyzer(tmp_path, monkeypatch, messages, use_batch_api=True,
+                             batch_api_threshold=1, batch_poll_interval=0,
+                             batch_state_path=str(tmp_path / 'state.json'))
+    monkeypatch.setattr(categorymaker, 'BATCH_MAX_REQUESTS', 2)
+    monkeypatch.setattr(base_analyzer.time, 'sleep', lambda seconds: None)
+    write_input(tmp_path / 'input.xlsx')
+
+    analyzer.analyze_feedback(str(tmp_path / 'input.xlsx'), str(tmp_path / 'output.xlsx'))
+
+    assert [len(requests) for requests in batches.submitted.values()] == [2, 1]
+    assert not (tmp_path / 'state.json').exists()
+    result = pd.read_excel(tmp_path / 'output.xlsx')
+    assert result['support needs_categories'].tolist() == [
+        'mentoring; time', 'No input data', 'mentoring; time', 'mentoring; time'
+    ]
+
+
+def test_process_batch_strips_echoed_row_labels(tmp_path, monkeypatch):
+    messages = MarshalMessages("ROW 1: Needs: a0 --- Feedback: b0 ###ROW### ROW 2:\nNeeds: a1 --- Feedback: b1")
+    analyzer = make_analyzer(tmp_path, monkeypatch, messages, cache_path=str(tmp_path / 'cache.sqlite'))
+    rows = [{'tyo': 'too fast'}, {'tyo': 'more support'}]
+
+    results = analyzer.process_batch(rows)
+
+    categories = analyzer.extract_categories(pd.Series(results))
+    assert categories['support needs_categories'].tolist() == ['a0', 'a1']
+    assert categories['general feedback_categories'].tolist() == ['b0', 'b1']
+    assert messages.calls == 1
+    # Marshaled results never answer a single-row lookup
+    row_text = analyzer.format_row(rows[0])
+    assert analyzer.lookup_cache(row_text) is None
+    assert analyzer.lookup_cache(row_text, marshaled=True) == results[0]
+
+
+def test_process_batch_falls_back_on_wrong_part_count(tmp_path, monkeypatch):
+    messages = MarshalMessages("Needs: a0 --- Feedback: b0")
+    analyzer = make_analyzer(tmp_path, monkeypatch, messages)
+
+    results = analyzer.process_batch([{'tyo': 'too fast'}, {'tyo': 'more support'}])
+
+    assert results == [analyzer.clean_text(ANSWER)] * 2
+    assert messages.calls == 3
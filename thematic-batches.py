@@ -1,12 +1,14 @@
 import pandas as pd
-import anthropic
-import os
-from dotenv import load_dotenv
-from typing import List, Tuple, Dict
-import yaml
+import numpy as np
+from typing import Iterator, List, Tuple, Dict
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from base_analyzer import BaseAnalyzer, get_client
 
-class ThematicAnalyzer:
+# Rough characters-per-token ratio used to estimate prompt size
+CHARS_PER_TOKEN = 4
+
+class ThematicAnalyzer(BaseAnalyzer):
     def __init__(self, config_path: str):
         """
         Initialize the ThematicAnalyzer with configuration.
@@ -15,23 +17,34 @@ class ThematicAnalyzer:
             config_path: Path to YAML configuration file
         """
         self.load_dotenv()
-        self.client = anthropic.Client(api_key=os.getenv('ANTHROPIC_API_KEY'))
+        self.client = get_client()
         self.config = self.load_config(config_path)
         self.output_dir = Path(self.config.get('output_directory', 'analysis_output'))
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.max_batch_size = self.config.get('max_batch_size', 20)  # Default to 20 based on experience
-        self.batch_by = self.config.get('batch_by', 'rows')  # 'rows' or 'categories'
+        self.batch_by = self.config.get('batch_by', 'rows')  # 'rows', 'categories' or 'tokens'
+        self.max_batch_tokens = self.config.get('max_batch_tokens', 8000)
+        self.max_workers = self.config.get('max_workers', 8)
+        self.merge_fanout = max(2, self.config.get('merge_fanout', 8))
         
     @staticmethod
-    def load_dotenv() -> None:
-        """Load environment variables."""
-        load_dotenv()
-    
+    def estimate_tokens(text: str) -> int:
+        """Estimate the number of tokens text adds to a prompt, including its separator."""
+        return -(-len(text) // CHARS_PER_TOKEN) + 1
+
     @staticmethod
-    def load_config(config_path: str) -> dict:
-        """Load configuration from YAML file."""
-        with open(config_path, 'r', encoding='utf-8') as file:
-            return yaml.safe_load(file)
+    def _iter_category_lists(df: pd.DataFrame, column_name: str) -> Iterator[List[str]]:
+        """
+        Yield the stripped, non-empty categories of each row with a value.
+        
+        Args:
+            df: DataFrame containing the categories
+            column_name: Name of the column containing categories
+        """
+        for value in df[column_name].to_numpy():
+            # Missing values are float NaN and fail the isinstance check
+            if isinstance(value, str):
+                yield [cat for cat in (part.strip() for part in value.split(';')) if cat]
 
     def collect_categories(self, df: pd.DataFrame, column_name: str) -> List[List[str]]:
         """
@@ -44,52 +57,49 @@ class ThematicAnalyzer:
         Returns:
             List of category batches
         """
-        batches = []
-        current_batch = []
-        current_count = 0
+        category_lists = list(self._iter_category_lists(df, column_name))
+        values = np.array([cat for cats in category_lists for cat in cats], dtype=object)
 
         if self.batch_by == 'rows':
-            # Batch by number of rows
-            for i in range(len(df)):
-                row = df.iloc[i]
-                if pd.notna(row[column_name]):
-                    categories = [cat.strip() for cat in row[column_name].split(';') if cat.strip()]
-                    
-                    if current_count >= self.max_batch_size:
-                        batches.append(current_batch)
-                        current_batch = []
-                        current_count = 0
-                    
-                    current_batch.extend(categories)
-                    current_count += 1
+            # Batch by number of rows: cut wherever a row starts a new group of max_batch_size rows
+            row_ends = np.cumsum([len(cats) for cats in category_lists], dtype=np.int64)
+            cut_points = row_ends[self.max_batch_size - 1:-1:self.max_batch_size]
+            batches = [batch.tolist() for batch in np.split(values, cut_points) if len(batch)]
             
+        elif self.batch_by == 'tokens':
+            # Batch by estimated prompt tokens, with max_batch_size as a hard ceiling
+            batches = []
+            current_batch = []
+            current_tokens = 0
+            for cat in values:
+                tokens = self.estimate_tokens(cat)
+                if current_batch and (current_tokens + tokens > self.max_batch_tokens
+                                      or len(current_batch) >= self.max_batch_size):
+                    batches.append(current_batch)
+                    current_batch = []
+                    current_tokens = 0
+                current_batch.append(cat)
+                current_tokens += tokens
+            if current_batch:
+                batches.append(current_batch)
+
         else:  # batch_by == 'categories'
             # Batch by number of individual categories
-            for i in range(len(df)):
-                row = df.iloc[i]
-                if pd.notna(row[column_name]):
-                    categories = [cat.strip() for cat in row[column_name].split(';') if cat.strip()]
-                    
-                    if current_count + len(categories) > self.max_batch_size:
-                        batches.append(current_batch)
-                        current_batch = []
-                        current_count = 0
-                    
-                    current_batch.extend(categories)
-                    current_count += len(categories)
-
-        # Add the last batch if it's not empty
-        if current_batch:
-            batches.append(current_batch)
+            batches = [values[i:i + self.max_batch_size].tolist()
+                       for i in range(0, len(values), self.max_batch_size)]
 
         # Debug information
         print(f"\nBatching Summary:")
         print(f"Batch method: {self.batch_by}")
         print(f"Maximum batch size: {self.max_batch_size}")
+        if self.batch_by == 'tokens':
+            print(f"Maximum batch tokens: {self.max_batch_tokens}")
         print(f"Number of batches created: {len(batches)}")
         for i, batch in enumerate(batches, 1):
             if self.batch_by == 'rows':
                 print(f"Batch {i}: {len(batch)} categories from approximately {self.max_batch_size} rows")
+            elif self.batch_by == 'tokens':
+                print(f"Batch {i}: {len(batch)} categories, ~{sum(map(self.estimate_tokens, batch))} tokens")
             else:
                 print(f"Batch {i}: {len(batch)} categories")
 
@@ -116,12 +126,12 @@ class ThematicAnalyzer:
                 categories='; '.join(categories)
             )
 
-        response = self.client.messages.create(
-            model=self.config.get('model', "claude-3-5-sonnet-20240620"),
-            max_tokens=self.config.get('max_tokens', 4000),
-            temperature=self.config.get('temperature', 0),
-            messages=[{"role": "user", "content": prompt}]
-        )
+        response = self._call_with_retry({
+            'model': self.config.get('model', "claude-3-5-sonnet-20240620"),
+            'max_tokens': self.config.get('max_tokens', 4000),
+            'temperature': self.config.get('temperature', 0),
+            'messages': [{"role": "user", "content": prompt}]
+        })
         
         return response.content[0].text
 
@@ -130,17 +140,18 @@ class ThematicAnalyzer:
         """
         Analyze categories in batches.
         """
-        all_analyses = []
-        total_categories = 0
+        print(f"Analyzing {len(categories)} batches for {category_type}...")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.get_analysis_from_claude, batch, category_type)
+                       for batch in categories]
+            all_analyses = [future.result() for future in futures]
         
-        for i, batch in enumerate(categories, 1):
-            print(f"Analyzing batch {i}/{len(categories)} for {category_type}...")
-            analysis = self.get_analysis_from_claude(batch, category_type)
-            all_analyses.append(analysis)
-            
+        total_categories = 0
+        for i, analysis in enumerate(all_analyses, 1):
             # Count categories in this batch
             batch_categories = len([cat for cat in analysis.split(';') if cat.strip()])
             total_categories += batch_categories
+            print(f"Batch {i}/{len(all_analyses)}")
             print(f"Categories in batch: {batch_categories}")
             print(f"Running total: {total_categories}")
             print("---")
@@ -150,16 +161,25 @@ class ThematicAnalyzer:
     def save_intermediate_results(self, iteration: int, 
                                 categories: List[List[str]], 
                                 column: str) -> None:
-        """Save intermediate analysis results."""
-        output_file = self.output_dir / f'{column}_analysis_iteration_{iteration}.txt'
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(f"Iteration {iteration}\n\n")
-            for i, batch in enumerate(categories, 1):
-                f.write(f"Batch {i}:\n")
-                f.write('; '.join(batch))
-                f.write("\n\n")
+        """Save intermediate analysis results, one row per category."""
+        output_file = self.output_dir / f'{column}_analysis_iteration_{iteration}.parquet'
+        pd.DataFrame({
+            'category': [cat for batch in categories for cat in batch],
+            'batch': [i for i, batch in enumerate(categories, 1) for _ in batch],
+            'iteration': iteration
+        }).to_parquet(output_file, index=False, compression='zstd')
         print(f"Saved intermediate results to {output_file}")
 
+        if self.config.get('debug_intermediate', False):
+            output_file = self.output_dir / f'{column}_analysis_iteration_{iteration}.txt'
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(f"Iteration {iteration}\n\n")
+                for i, batch in enumerate(categories, 1):
+                    f.write(f"Batch {i}:\n")
+                    f.write('; '.join(batch))
+                    f.write("\n\n")
+            print(f"Saved intermediate results to {output_file}")
+
     def iterative_aggregation(self, df: pd.DataFrame, 
                             column: str, category_type: str) -> None:
         """
@@ -172,15 +192,21 @@ class ThematicAnalyzer:
         
         while len(categories) > 1:
             print(f"\nIteration {iteration}")
-            new_categories = []
             
-            for i in range(0, len(categories), 2):
-                if i + 1 < len(categories):
-                    merged_batch = categories[i] + categories[i+1]
-                    analysis = self.get_analysis_from_claude(merged_batch, category_type)
-                    new_categories.append(analysis.split(';'))
-                else:
-                    new_categories.append(categories[i])
+            # Merge up to merge_fanout sibling batches per call; groups on one level
+            # are independent, so merge them concurrently
+            groups = [categories[i:i + self.merge_fanout]
+                      for i in range(0, len(categories), self.merge_fanout)]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(self.get_analysis_from_claude,
+                                    [cat for batch in group for cat in batch], category_type)
+                    if len(group) > 1 else None
+                    for group in groups
+                ]
+                # A single leftover batch is carried over to the next iteration unchanged
+                new_categories = [future.result().split(';') if future else group[0]
+                                  for future, group in zip(futures, groups)]
             
             categories = new_categories
             print(f"Batches after iteration {iteration}: {len(categories)}")
@@ -205,7 +231,10 @@ def main():
     analyzer = ThematicAnalyzer('thematic_config.yaml')
     input_file = analyzer.config.get('input_file', 'analysis_results.xlsx')
     
-    df = pd.read_excel(input_file)
+    if Path(input_file).suffix == '.parquet':
+        df = pd.read_parquet(input_file)
+    else:
+        df = pd.read_excel(input_file)
     
     # Process each category type
     for column, category_type in analyzer.config['category_types'].items():